@@ -0,0 +1,301 @@
+# api.py
+"""
+Headless attendance API for kiosks, served without Streamlit.
+
+    python api.py --port 8080 --face-workers 4
+
+    POST /attendance?roll_no=<roll no>   (or ?student_id=<id>)
+         body: raw JPEG/PNG bytes from the kiosk camera
+    POST /attendance/qr?token=<code scanned from the ID card>
+         body: empty, or a camera frame when the previous reply asked for one
+    GET  /health
+    GET  /metrics
+
+Connections are kept alive (HTTP/1.1) and face recognition runs on a bounded
+worker pool; when the pool's queue is full the API answers 503 straight away
+instead of piling up requests. Responses are JSON.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from database import get_db_connection, setup_database
+from features import recognize_face
+from fast_lane import (fast_lane_check_in, claim_mark, release_mark,
+                       FACE_REQUIRED, DUPLICATE_SCAN, NOT_RECOGNIZED, REJECTED)
+from write_queue import get_write_queue, mark_attendance, wait_for
+
+MAX_PHOTO_BYTES = 5 * 1024 * 1024
+FACE_QUEUE_PER_WORKER = 4  # Requests allowed to wait for a face worker before we shed load
+CONNECTION_TIMEOUT = 30  # Seconds an idle or stalled kiosk connection may hold a handler thread
+
+
+class FaceBusy(Exception):
+    """Raised when the face worker pool is full; answered with 503."""
+
+
+class Metrics:
+    """Thread-safe counters reported by /metrics."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.in_flight = 0
+        self.responses = {}
+        self.recognized = 0
+        self.not_recognized = 0
+        self.rejected_busy = 0
+        self.qr_fast_lane = 0
+        self.qr_rejected = 0
+        self.qr_duplicate = 0
+        self.face_duplicate = 0
+        self.attendance_seconds = 0.0
+        self.attendance_requests = 0
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def end(self, status):
+        with self._lock:
+            self.in_flight -= 1
+            self.responses[str(status)] = self.responses.get(str(status), 0) + 1
+
+    def add(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "responses": dict(self.responses),
+                "recognized": self.recognized,
+                "not_recognized": self.not_recognized,
+                "rejected_busy": self.rejected_busy,
+                "qr_fast_lane": self.qr_fast_lane,
+                "qr_rejected": self.qr_rejected,
+                "qr_duplicate": self.qr_duplicate,
+                "face_duplicate": self.face_duplicate,
+                "attendance_avg_ms": round(1000 * self.attendance_seconds / self.attendance_requests, 1)
+                                     if self.attendance_requests else None,
+            }
+
+
+class AttendanceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive: kiosks reuse one connection
+    server_version = "StudentPortalAPI"
+    timeout = CONNECTION_TIMEOUT  # Keep-alive sockets that go quiet are closed instead of pinning a thread
+
+    def log_message(self, format, *args):
+        pass  # Access logging per request costs more than the request itself under load
+
+    def _send_json(self, status, payload):
+        self._responded = True
+        try:
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            self.server.metrics.end(status)
+
+    def _dispatch(self, handler):
+        """Runs a request handler, making sure every request gets exactly one reply and is counted."""
+        self.server.metrics.begin()
+        self._responded = False
+        try:
+            handler()
+        except Exception as e:
+            self.close_connection = True  # The request body or reply may be half-done; don't reuse the socket
+            if not self._responded:
+                try:
+                    self._send_json(500, {"error": f"Internal error: {e}"})
+                except OSError:
+                    pass
+
+    def do_GET(self):
+        self._dispatch(self._handle_get)
+
+    def do_POST(self):
+        self._dispatch(self._handle_post)
+
+    def _handle_get(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            try:
+                with get_db_connection() as cursor:
+                    cursor.execute("SELECT 1")
+                self._send_json(200, {"status": "ok"})
+            except Exception as e:
+                self._send_json(503, {"status": "error", "message": str(e)})
+        elif path == "/metrics":
+            self._send_json(200, self.server.metrics.snapshot())
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def _handle_post(self):
+        url = urlparse(self.path)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True  # Without a valid length the body cannot be skipped
+            self._send_json(400, {"error": "Invalid Content-Length"})
+            return
+        if length > MAX_PHOTO_BYTES:
+            self.close_connection = True  # Body is not read, so the connection cannot be reused
+            self._send_json(413, {"error": "Photo too large"})
+            return
+        body = self.rfile.read(length)
+        if url.path == "/attendance":
+            self._attendance(parse_qs(url.query), body)
+        elif url.path == "/attendance/qr":
+            self._qr_attendance(parse_qs(url.query), body)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def _lookup_student(self, query):
+        """Returns (student_id, face_encoding) by student_id or roll_no, or None."""
+        with get_db_connection() as cursor:
+            if "student_id" in query:
+                cursor.execute("SELECT id, face_encoding FROM students WHERE id = ?", (query["student_id"][0],))
+            elif "roll_no" in query:
+                cursor.execute("SELECT id, face_encoding FROM students WHERE roll_no = ?", (query["roll_no"][0],))
+            else:
+                return None
+            return cursor.fetchone()
+
+    def _attendance(self, query, photo_bytes):
+        started = time.monotonic()
+        student = self._lookup_student(query)
+        if not student:
+            self._send_json(404, {"error": "Student not found. Pass ?roll_no= or ?student_id="})
+            return
+        student_id, face_encoding = student
+        if not face_encoding:
+            self._send_json(422, {"error": "No face data registered for this student."})
+            return
+        if not photo_bytes:
+            self._send_json(400, {"error": "No photo provided."})
+            return
+
+        # Same repeat window as the QR lane, so a photo right after a card scan is not a Time Out
+        claim = claim_mark(student_id)
+        if not claim:
+            self.server.metrics.add("face_duplicate")
+            self._send_json(200, {"duplicate": True, "message": "Already checked in moments ago."})
+            return
+        try:
+            is_recognized, message = self._recognize(face_encoding, photo_bytes)
+        except FaceBusy:
+            release_mark(student_id, claim)
+            self._send_busy()
+            return
+        except Exception:
+            release_mark(student_id, claim)
+            raise
+        if not is_recognized:
+            release_mark(student_id, claim)
+            self._send_json(200, {"recognized": False, "message": message})
+            return
+        try:
+            outcome = wait_for(mark_attendance(student_id))
+        except Exception as e:
+            release_mark(student_id, claim)
+            self._send_json(500, {"error": f"Could not mark attendance: {e}"})
+            return
+        self._record_latency(started)
+        self._send_json(200, {"recognized": True, "student_id": student_id, "attendance": outcome})
+
+    def _qr_attendance(self, query, photo_bytes):
+        started = time.monotonic()
+        try:
+            outcome, message, face_checked = fast_lane_check_in(query.get("token", [None])[0], photo_bytes,
+                                                                recognize=self._recognize)
+        except FaceBusy:
+            self._send_busy()
+            return
+        if outcome == REJECTED:
+            self.server.metrics.add("qr_rejected")
+            self._send_json(403, {"error": message})
+        elif outcome == FACE_REQUIRED:
+            self._send_json(200, {"face_required": True, "message": message})
+        elif outcome == NOT_RECOGNIZED:
+            self._send_json(200, {"recognized": False, "message": message})
+        elif outcome == DUPLICATE_SCAN:
+            self.server.metrics.add("qr_duplicate")
+            self._send_json(200, {"duplicate": True, "message": message})
+        else:
+            if not face_checked:
+                self.server.metrics.add("qr_fast_lane")
+            self._record_latency(started)
+            self._send_json(200, {"face_required": False, "face_checked": face_checked, "attendance": outcome})
+
+    def _recognize(self, face_encoding, photo_bytes):
+        """Runs face recognition on the bounded pool; raises FaceBusy when the pool is full."""
+        if not self.server.face_slots.acquire(blocking=False):
+            raise FaceBusy()
+        try:
+            is_recognized, message = self.server.face_pool.submit(recognize_face, face_encoding, photo_bytes).result()
+        finally:
+            self.server.face_slots.release()
+        self.server.metrics.add("recognized" if is_recognized else "not_recognized")
+        return is_recognized, message
+
+    def _send_busy(self):
+        self.server.metrics.add("rejected_busy")
+        self._send_json(503, {"error": "Face recognition is busy, please retry."})
+
+    def _record_latency(self, started):
+        self.server.metrics.add("attendance_seconds", time.monotonic() - started)
+        self.server.metrics.add("attendance_requests")
+
+
+class AttendanceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, face_workers):
+        super().__init__(address, AttendanceHandler)
+        self.metrics = Metrics()
+        self.face_pool = ThreadPoolExecutor(max_workers=face_workers, thread_name_prefix="face")
+        # Bounds requests running or waiting on the pool
+        self.face_slots = threading.BoundedSemaphore(face_workers * (1 + FACE_QUEUE_PER_WORKER))
+
+    def server_close(self):
+        super().server_close()
+        self.face_pool.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless attendance API for kiosks.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--face-workers", type=int, default=os.cpu_count() or 1,
+                        help="Concurrent face recognitions (default: CPU count)")
+    args = parser.parse_args()
+
+    setup_database()
+    get_write_queue()  # Start the writer before the first check-in arrives
+    server = AttendanceServer((args.host, args.port), args.face_workers)
+    print(f"Attendance API listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,21 @@
 # app.py
 import streamlit as st
 import datetime 
+import sqlite3
+import time
+import uuid
 import numpy as np # Needed to convert BLOB back to numpy array for face encoding
 
 # Import functions/classes from your new files
 from database import get_db_connection, setup_database, get_user_role
 from utils import display_error, display_success, validate_input, Course
-from features import recognize_face, process_payment, generate_id_card, get_face_encoding_from_photo
+from features import recognize_face, generate_id_card, get_face_encoding_from_photo
+from write_queue import mark_attendance, submit_marks, save_student, TIME_IN, TIME_OUT, wait_for
+from archive import create_term, list_terms, archive_term, compact_database, get_history_connection
+from replica import get_replica_connection, refresh_replica, replica_age, start_replica_refresher
+from print_jobs import submit_print_job, retry_print_job, list_print_jobs, get_print_card, recover_stale_jobs
+
+PRINT_JOB_POLL_SECONDS = 2  # Rerun interval while a print job is processing
 
 # --- Main Streamlit App ---
 def main():
@@ -125,24 +134,15 @@ def main():
                                 # For demo, we allow submission without face_encoding if it fails.
                                 # In a real app, you might want to prevent it or warn strongly.
 
-                        with get_db_connection() as cursor:
-                            cursor.execute("SELECT id FROM students WHERE user_id = ?", (st.session_state['user_id'],))
-                            existing_student = cursor.fetchone()
-                            
-                            if existing_student:
-                                # Update existing student
-                                cursor.execute("""
-                                    UPDATE students SET name=?, roll_no=?, email=?, slot=?, contact=?, course_id=?, 
-                                    favorite_teacher_id=?, photo=?, face_encoding=? WHERE user_id=?
-                                """, (name, roll_no, email, slot, contact, course_id, favorite_teacher_id, photo_bytes, face_encoding_data, st.session_state['user_id']))
-                                
+                        # Insert or update goes through the single writer thread
+                        try:
+                            outcome = wait_for(save_student(st.session_state['user_id'], name, roll_no, email, slot, contact,
+                                                            course_id, favorite_teacher_id, photo_bytes, face_encoding_data))
+                        except Exception as e:
+                            display_error(f"Could not save student information: {e}")
+                        else:
+                            if outcome == "updated":
                                 display_success("Student information updated successfully!")
-                            else:
-                                # Insert new student
-                                cursor.execute("""
-                                    INSERT INTO students (user_id, name, roll_no, email, slot, contact, course_id, favorite_teacher_id, photo, face_encoding)
-                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                """, (st.session_state['user_id'], name, roll_no, email, slot, contact, course_id, favorite_teacher_id, photo_bytes, face_encoding_data))
                             display_success("Student information saved successfully!")
 
             # --- Fetch and Display Student Data ---
@@ -162,6 +162,7 @@ def main():
             if student_data:
                 student_id = student_data[0]
                 student_dict = {
+                    'id': student_id,
                     'name': student_data[1],
                     'roll_no': student_data[2],
                     'email': student_data[3],
@@ -208,23 +209,18 @@ def main():
                             is_recognized, message = recognize_face(student_dict['face_encoding'], attendance_photo_bytes)
                             
                             if is_recognized:
-                                with get_db_connection() as cursor:
-                                    #check if time_in is already marked today
-                                    cursor.execute("SELECT id, time_in, time_out FROM attendance WHERE student_id = ? AND DATE(time_in) = DATE('now')", (student_id,))
-                                    attendance_record = cursor.fetchone()
-                                    
-                                    if attendance_record:
-                                        if attendance_record[2]:
-                                            st.success("Attendance already completed for today.")
-                                        else:
-                                            # update time_out
-                                            cursor.execute("UPDATE attendance SET time_out = DATETIME('now') WHERE id = ?", (attendance_record[0],))
-                                            st.success("Attendance marked (Time Out).")
-                                    else:
-                                        # mark new entry
-                                        cursor.execute("INSERT INTO attendance (student_id, time_in) VALUES (?, DATETIME('now'))", (student_id,))
+                                # Queued to the writer thread, which decides Time In / Time Out / completed
+                                try:
+                                    outcome = wait_for(mark_attendance(student_id))
+                                except Exception as e:
+                                    display_error(f"Could not mark attendance: {e}")
+                                else:
+                                    if outcome == TIME_IN:
                                         st.success("Attendance marked (Time In).")
-                                    
+                                    elif outcome == TIME_OUT:
+                                        st.success("Attendance marked (Time Out).")
+                                    else:
+                                        st.success("Attendance already completed for today.")
                             else:
                                 display_error(f"Face recognition failed: {message}")
                         else:
@@ -235,11 +231,14 @@ def main():
 
                 # Display attendance
                 st.subheader("Attendance History")
-                with get_db_connection() as cursor:
+                include_archived = st.checkbox("Include archived terms", key="history_include_archived")
+                with get_history_connection(include_archives=include_archived) as (cursor, omitted_terms):
                     cursor.execute("""
-                        SELECT time_in, time_out FROM attendance WHERE student_id = ? ORDER BY time_in DESC
+                        SELECT time_in, time_out FROM attendance_all WHERE student_id = ? ORDER BY time_in DESC
                     """, (student_id,))
                     attendance_records = cursor.fetchall()
+                    if omitted_terms:
+                        st.warning(f"Older archived terms not included: {', '.join(omitted_terms)}.")
                     
                     if attendance_records:
                         for record in attendance_records:
@@ -254,16 +253,12 @@ def main():
                 st.subheader("Submit / View Result")
                 marks = st.number_input("Enter Marks (0-100):", min_value=0, max_value=100, step=1, key="marks_input")
                 if st.button("Submit Marks"):
-                    with get_db_connection() as cursor:
-                            #check if result already exists
-                        cursor.execute("SELECT id FROM results WHERE student_id = ?", (student_id,))
-                        existing_result = cursor.fetchone()
-                        if existing_result:
-                            #update
-                            cursor.execute("UPDATE results SET marks = ? WHERE student_id = ?", (marks, student_id))
-                        else:
-                            cursor.execute("INSERT INTO results (student_id, marks) VALUES (?, ?)", (student_id, marks))
-                    st.success("Marks submitted!")
+                    try:
+                        wait_for(submit_marks(student_id, marks))
+                    except Exception as e:
+                        display_error(f"Could not submit marks: {e}")
+                    else:
+                        st.success("Marks submitted!")
 
                 if st.button("View Result"):
                     with get_db_connection() as cursor:
@@ -281,27 +276,76 @@ def main():
                     else:
                         st.info("Result not available yet. Please submit your marks.")
 
-                if st.button("Print ID Card (Paid Service)"):
+                amount = 100  # Fixed amount for printing
+                token = "dummy_token" # Replace with a real payment token from your payment gateway
+                recover_stale_jobs()  # Jobs cut off by a restart become failed, so they can be retried
+                print_jobs = list_print_jobs(student_id)
+                # One idempotency key per print request: repeat clicks map to the same job
+                # instead of charging again. A new key is only made when the student asks
+                # for another copy, and not while their last print is still processing.
+                if 'print_job_key' not in st.session_state:
+                    st.session_state['print_job_key'] = str(uuid.uuid4())
+                if 'print_job_id' in st.session_state:
+                    print_clicked = st.button("Print Another Copy (Paid Service)")
+                    last_job = next((job for job in print_jobs if job[0] == st.session_state['print_job_id']), None)
+                    if print_clicked and last_job and last_job[1] != 'processing':
+                        st.session_state['print_job_key'] = str(uuid.uuid4())
+                else:
+                    print_clicked = st.button("Print ID Card (Paid Service)")
+                if print_clicked:
                     if student_data:
-                        amount = 100  # Fixed amount for printing
-                        token = "dummy_token" # Replace with a real payment token from your payment gateway
-                        payment_status, payment_message = process_payment(amount, token)
-                        if payment_status == "success":
-                            st.success(f"Payment of {amount} successful. Printing ID card...")
-                            id_card_bytes = generate_id_card(student_dict)  # regenerate
-                            if id_card_bytes:
-                                st.image(id_card_bytes, caption="Printed Student ID Card", use_column_width=True)
-                                # You can add a download button here if you want users to download the image
-                                st.download_button(
-                                    label="Download ID Card",
-                                    data=id_card_bytes,
-                                    file_name="student_id_card.png",
-                                    mime="image/png"
-                                )
+                        try:
+                            job_id = submit_print_job(student_id, student_dict, amount, token, st.session_state['print_job_key'])
+                        except Exception as e:
+                            display_error(f"Could not queue print job: {e}")
                         else:
-                            st.error(f"Payment failed: {payment_message}")
+                            st.session_state['print_job_id'] = job_id
+                            st.info(f"Print job #{job_id} queued. Payment of {amount} and card rendering are in progress.")
+                            print_jobs = list_print_jobs(student_id)
                     else:
                         st.warning("Please submit your student information and generate the ID Card first.")
+
+                if print_jobs:
+                    st.write("#### Your Print Jobs")
+                    for job_id, status, payment_status, payment_message, card_status, created_at in print_jobs:
+                        if status == 'processing':
+                            st.write(f"Job #{job_id} ({created_at}): processing...")
+                        elif status == 'done':
+                            st.write(f"Job #{job_id} ({created_at}): payment successful, ID card ready.")
+                            # Card bytes are read from disk only for the job the student asked for
+                            if st.session_state.get('print_download_job') == job_id:
+                                card_bytes = get_print_card(job_id)
+                                if card_bytes:
+                                    st.download_button(
+                                        label=f"Download ID Card (Job #{job_id})",
+                                        data=card_bytes,
+                                        file_name="student_id_card.png",
+                                        mime="image/png",
+                                        key=f"download_print_job_{job_id}"
+                                    )
+                                else:
+                                    st.warning("The printed card file is no longer available. Please print again.")
+                            elif st.button(f"Get ID Card (Job #{job_id})", key=f"get_print_job_{job_id}"):
+                                st.session_state['print_download_job'] = job_id
+                                st.experimental_rerun()
+                        else:
+                            reason = f"Payment failed: {payment_message}" if payment_status == 'failure' else "Could not render ID card."
+                            st.write(f"Job #{job_id} ({created_at}): {reason}")
+                            if st.button(f"Retry Job #{job_id}", key=f"retry_print_job_{job_id}"):
+                                try:
+                                    restarted = retry_print_job(job_id, token)
+                                except Exception as e:
+                                    display_error(f"Could not retry print job: {e}")
+                                else:
+                                    if restarted:
+                                        st.info(f"Print job #{job_id} restarted.")
+                                        st.experimental_rerun()
+
+                    # Poll while any job is in flight; this is the last section of the page, so it all renders first
+                    if any(job[1] == 'processing' for job in print_jobs):
+                        st.caption("Print jobs in progress, updating automatically...")
+                        time.sleep(PRINT_JOB_POLL_SECONDS)
+                        st.experimental_rerun()
             else:
                 st.info("Please fill out the student registration form above to get started.")
 
@@ -310,9 +354,23 @@ def main():
             st.subheader("Admin Dashboard")
             st.write("Welcome Admin! You can manage users, courses, and teachers here.")
 
+            # Listings and reports below read a periodic snapshot so long scans never delay check-in writes
+            start_replica_refresher()
+            snapshot_age = replica_age()
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                if snapshot_age is None:
+                    st.caption("Reports: snapshot not taken yet.")
+                else:
+                    st.caption(f"Reports: data as of {int(snapshot_age)} seconds ago.")
+            with col2:
+                if st.button("Refresh Snapshot"):
+                    refresh_replica()
+                    st.experimental_rerun()
+
             # --- Display list of students for Admin ---
             st.write("### All Registered Students")
-            with get_db_connection() as cursor:
+            with get_replica_connection() as (cursor, _):
                 cursor.execute("""
                     SELECT s.name, s.roll_no, s.email, c.name AS course_name, t.name AS teacher_name
                     FROM students s
@@ -373,28 +431,80 @@ def main():
                 all_teachers = [row[0] for row in cursor.fetchall()]
             st.write("**Existing Teachers:**", ", ".join(all_teachers) if all_teachers else "None")
 
+            # --- Admin: Manage Terms ---
+            st.write("### Manage Terms")
+            with st.form("add_term_form"):
+                new_term_name = st.text_input("New Term Name")
+                term_start = st.date_input("Start Date", key="term_start")
+                term_end = st.date_input("End Date", key="term_end")
+                add_term_button = st.form_submit_button("Add Term")
+                if add_term_button:
+                    if new_term_name:
+                        try:
+                            create_term(new_term_name, term_start, term_end)
+                            display_success(f"Term '{new_term_name}' added successfully!")
+                        except sqlite3.IntegrityError:
+                            display_error(f"Term '{new_term_name}' already exists.")
+                        except ValueError as e:
+                            display_error(str(e))
+                    else:
+                        display_error("Please enter a term name.")
+
+            terms = list_terms()
+            if terms:
+                st.table(data=[["Term", "Start", "End", "Status"]] +
+                         [[name, start, end, "Archived" if path else "Live"] for name, start, end, path in terms])
+                open_terms = [name for name, start, end, path in terms if not path]
+                if open_terms:
+                    term_to_archive = st.selectbox("Term to archive", options=open_terms)
+                    if st.button("Archive Term"):
+                        try:
+                            attendance_moved, results_moved = archive_term(term_to_archive)
+                            refresh_replica()  # So the reports below label the moved rows with their term
+                            display_success(f"Archived '{term_to_archive}': {attendance_moved} attendance records, "
+                                            f"{results_moved} results moved out of the live database.")
+                        except ValueError as e:
+                            display_error(str(e))
+                # Archiving frees pages inside the file; shrinking it is a separate, off-peak step
+                st.caption("Compacting locks the database for check-ins while it runs. Only use it off-peak.")
+                if st.button("Compact Database"):
+                    try:
+                        compact_database()
+                        refresh_replica()
+                        display_success("Database compacted.")
+                    except sqlite3.OperationalError as e:
+                        display_error(f"Could not compact the database: {e}")
+            else:
+                st.info("No terms defined yet.")
+
+            include_archived = st.checkbox("Include archived terms in records below", key="admin_include_archived")
+
             # --- Admin: View Attendance of all students ---
             st.write("### All Student Attendance Records")
-            with get_db_connection() as cursor:
+            with get_replica_connection(include_archives=include_archived) as (cursor, omitted_terms):
                 cursor.execute("""
-                    SELECT s.name, s.roll_no, a.time_in, a.time_out
-                    FROM attendance a
+                    SELECT s.name, s.roll_no, a.time_in, a.time_out, COALESCE(a.term, 'Current')
+                    FROM attendance_all a
                     JOIN students s ON a.student_id = s.id
                     ORDER BY a.time_in DESC
                 """)
                 all_attendance_records = cursor.fetchall()
+                if omitted_terms:
+                    st.warning(f"Older archived terms not included: {', '.join(omitted_terms)}.")
 
                 if all_attendance_records:
-                    st.table(data=[["Student Name", "Roll No", "Time In", "Time Out"]] + list(all_attendance_records))
+                    st.table(data=[["Student Name", "Roll No", "Time In", "Time Out", "Term"]] + list(all_attendance_records))
                 else:
                     st.info("No attendance records found yet.")
 
             # --- Admin: View All Results ---
             st.write("### All Student Results")
-            with get_db_connection() as cursor:
+            with get_replica_connection(include_archives=include_archived) as (cursor, omitted_terms):
+                if omitted_terms:
+                    st.warning(f"Older archived terms not included: {', '.join(omitted_terms)}.")
                 cursor.execute("""
-                    SELECT s.name, s.roll_no, c.name AS course_name, r.marks
-                    FROM results r
+                    SELECT s.name, s.roll_no, c.name AS course_name, r.marks, COALESCE(r.term, 'Current')
+                    FROM results_all r
                     JOIN students s ON r.student_id = s.id
                     JOIN courses c ON s.course_id = c.id
                     ORDER BY s.name, c.name
@@ -402,7 +512,7 @@ def main():
                 all_results = cursor.fetchall()
 
                 if all_results:
-                    st.table(data=[["Student Name", "Roll No", "Course", "Marks"]] + list(all_results))
+                    st.table(data=[["Student Name", "Roll No", "Course", "Marks", "Term"]] + list(all_results))
                 else:
                     st.info("No results submitted yet.")
 
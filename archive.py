@@ -0,0 +1,193 @@
+# archive.py
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+from database import DB_PATH, get_db_connection
+
+ARCHIVE_DIR = "archive"
+MAX_ATTACHED_TERMS = 9  # SQLite allows 10 attached databases by default; keep one spare
+
+
+def _archive_path(term_id):
+    """Per-term archive file, named by terms.id so two terms never share a file, e.g. archive/term_3.db"""
+    return os.path.join(ARCHIVE_DIR, f"term_{term_id}.db")
+
+def _sql_literal(value):
+    """Quotes a value for use inside a view definition (views cannot take parameters)."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+def create_term(name, start_date, end_date):
+    """Registers a term covering start_date..end_date (inclusive)."""
+    if end_date < start_date:
+        raise ValueError("Term end date must not be before its start date.")
+    with get_db_connection() as cursor:
+        cursor.execute("INSERT INTO terms (name, start_date, end_date) VALUES (?, ?, ?)",
+                       (name, str(start_date), str(end_date)))
+
+def list_terms():
+    """Returns (name, start_date, end_date, archive_path) for every term, newest first."""
+    with get_db_connection() as cursor:
+        cursor.execute("SELECT name, start_date, end_date, archive_path FROM terms ORDER BY end_date DESC")
+        return cursor.fetchall()
+
+def archive_term(term_name):
+    """
+    Moves a closed term's attendance and results out of the live database into
+    its own SQLite file. Returns (attendance_rows, result_rows) moved.
+
+    Runs in two transactions, because SQLite does not commit a transaction
+    spanning two files atomically when the live file is in WAL mode: first the
+    rows are copied into the term file and committed there, then, once the
+    copy is confirmed, only the copied rows are deleted from the live file.
+    Rows keep their original ids and are copied with INSERT OR REPLACE, so
+    running it again after an interruption at any point is safe.
+    Results are matched on submitted_at; results saved before that column
+    existed have no date and always stay in the live database.
+    Freed pages are reused by new rows; run compact_database() off-peak to
+    shrink the file itself.
+    """
+    with get_db_connection() as cursor:
+        cursor.execute("SELECT id, start_date, end_date, archive_path FROM terms WHERE name = ?", (term_name,))
+        term = cursor.fetchone()
+        cursor.execute("SELECT DATE('now')")
+        today = cursor.fetchone()[0]
+    if not term:
+        raise ValueError(f"Unknown term '{term_name}'.")
+    term_id, start_date, end_date, archive_path = term
+    if archive_path:
+        raise ValueError(f"Term '{term_name}' is already archived.")
+    if end_date >= today:
+        raise ValueError(f"Term '{term_name}' has not closed yet.")
+
+    path = _archive_path(term_id)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    # Rows from start_date through the whole of end_date
+    in_term = "{col} >= DATE(:start) AND {col} < DATE(:end, '+1 day')"
+    params = {"start": start_date, "end": end_date}
+
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=5000")
+    try:
+        conn.execute("ATTACH DATABASE ? AS term", (path,))
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS term.attendance (
+                id INTEGER PRIMARY KEY,
+                student_id INTEGER NOT NULL,
+                time_in DATETIME,
+                time_out DATETIME
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS term.results (
+                id INTEGER PRIMARY KEY,
+                student_id INTEGER NOT NULL,
+                marks INTEGER NOT NULL,
+                submitted_at DATETIME
+            )
+        """)
+        attendance_filter = in_term.format(col="time_in")
+        results_filter = in_term.format(col="submitted_at")
+
+        # Step 1: copy into the term file. Only that file is written, so this commit is atomic.
+        conn.execute("BEGIN")
+        try:
+            conn.execute(f"""
+                INSERT OR REPLACE INTO term.attendance (id, student_id, time_in, time_out)
+                SELECT id, student_id, time_in, time_out FROM main.attendance WHERE {attendance_filter}
+            """, params)
+            conn.execute(f"""
+                INSERT OR REPLACE INTO term.results (id, student_id, marks, submitted_at)
+                SELECT id, student_id, marks, submitted_at FROM main.results WHERE {results_filter}
+            """, params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        # Step 2: delete from the live file only what the term file now holds. Only main is written.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table, row_filter in (("attendance", attendance_filter), ("results", results_filter)):
+                live_rows = conn.execute(f"SELECT COUNT(*) FROM main.{table} WHERE {row_filter}", params).fetchone()[0]
+                copied_rows = conn.execute(f"""
+                    SELECT COUNT(*) FROM main.{table}
+                    WHERE {row_filter} AND id IN (SELECT id FROM term.{table})
+                """, params).fetchone()[0]
+                if copied_rows != live_rows:
+                    raise RuntimeError(f"Archive copy of {table} for term '{term_name}' is incomplete "
+                                       f"({copied_rows} of {live_rows} rows); nothing was deleted.")
+            conn.execute(f"""
+                DELETE FROM main.attendance WHERE {attendance_filter} AND id IN (SELECT id FROM term.attendance)
+            """, params)
+            attendance_moved = conn.execute("SELECT changes()").fetchone()[0]
+            conn.execute(f"""
+                DELETE FROM main.results WHERE {results_filter} AND id IN (SELECT id FROM term.results)
+            """, params)
+            results_moved = conn.execute("SELECT changes()").fetchone()[0]
+            conn.execute("UPDATE main.terms SET archive_path = ? WHERE id = ?", (path, term_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("DETACH DATABASE term")
+        return attendance_moved, results_moved
+    finally:
+        conn.close()
+
+def compact_database():
+    """
+    Rewrites the live file without the pages freed by archiving, so backups and
+    the read replica copy less. VACUUM holds the write lock for the whole
+    rewrite and check-ins fail while it runs: only run it off-peak.
+    """
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=5000")
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+@contextmanager
+def get_history_connection(include_archives=True, db_path=DB_PATH):
+    """
+    Read-only cursor for history queries, yielded as (cursor, omitted_terms).
+    With include_archives, archived terms are ATTACHed read-only and the temp
+    views attendance_all / results_all span the live tables and every attached
+    term (term is NULL for live rows). Without it, the views cover the live
+    tables only.
+
+    SQLite attaches at most MAX_ATTACHED_TERMS files at once, so only the most
+    recent archived terms are included; omitted_terms names the older ones that
+    were left out (or whose file is missing) so callers can say so.
+    """
+    conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+    cursor = conn.cursor()
+    try:
+        attendance_sources = ["SELECT student_id, time_in, time_out, NULL AS term FROM main.attendance"]
+        results_sources = ["SELECT student_id, marks, submitted_at, NULL AS term FROM main.results"]
+        omitted_terms = []
+        if include_archives:
+            cursor.execute("""
+                SELECT name, archive_path FROM terms
+                WHERE archive_path IS NOT NULL
+                ORDER BY end_date DESC
+            """)
+            archived = cursor.fetchall()
+            omitted_terms = [term_name for term_name, archive_path in archived[MAX_ATTACHED_TERMS:]]
+            for i, (term_name, archive_path) in enumerate(archived[:MAX_ATTACHED_TERMS]):
+                if not os.path.exists(archive_path):
+                    omitted_terms.append(term_name)
+                    continue
+                alias = f"term{i}"
+                cursor.execute(f"ATTACH DATABASE ? AS {alias}", (Path(archive_path).resolve().as_uri() + "?mode=ro",))
+                attendance_sources.append(
+                    f"SELECT student_id, time_in, time_out, {_sql_literal(term_name)} FROM {alias}.attendance")
+                results_sources.append(
+                    f"SELECT student_id, marks, submitted_at, {_sql_literal(term_name)} FROM {alias}.results")
+        cursor.execute("CREATE TEMP VIEW attendance_all AS " + " UNION ALL ".join(attendance_sources))
+        cursor.execute("CREATE TEMP VIEW results_all AS " + " UNION ALL ".join(results_sources))
+        yield cursor, omitted_terms
+    finally:
+        conn.close()
@@ -2,10 +2,12 @@
 import sqlite3
 from contextlib import contextmanager
 
+DB_PATH = "student_portal.db"
+
 @contextmanager
 def get_db_connection():
     """Context manager for database connection."""
-    conn = sqlite3.connect("student_portal.db")
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     try:
         yield cursor
@@ -66,14 +68,53 @@ def setup_database():
                 FOREIGN KEY (student_id) REFERENCES students(id)
             )
         """)
+        # Today's-record lookup on check-in is a range scan on this index
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_student_time_in ON attendance (student_id, time_in)")
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS results (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 student_id INTEGER NOT NULL,
                 marks INTEGER NOT NULL,
+                submitted_at DATETIME,
+                FOREIGN KEY (student_id) REFERENCES students(id)
+            )
+        """)
+        # Older databases were created before results carried a timestamp. Those rows keep
+        # submitted_at NULL (their real date is unknown), so term archival never moves them.
+        cursor.execute("PRAGMA table_info(results)")
+        if "submitted_at" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE results ADD COLUMN submitted_at DATETIME")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS terms (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                start_date DATE NOT NULL,
+                end_date DATE NOT NULL,
+                archive_path TEXT -- Set once the term's rows have been moved out of this file
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS print_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id INTEGER NOT NULL,
+                idempotency_key TEXT NOT NULL UNIQUE, -- Repeated submissions with the same key map to one job
+                amount INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'processing', -- processing, done, failed
+                payment_status TEXT NOT NULL DEFAULT 'pending', -- pending, success, failure
+                payment_message TEXT,
+                card_status TEXT NOT NULL DEFAULT 'pending', -- pending, ready, failed
+                card_path TEXT, -- Rendered PNG on disk; kept out of the database so the live file stays small
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME,
                 FOREIGN KEY (student_id) REFERENCES students(id)
             )
         """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
 
         # Insert initial courses if they don't exist
         for course_name in ["Python", "Typescript", "Next.js"]:
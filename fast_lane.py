@@ -0,0 +1,122 @@
+# fast_lane.py
+import random
+import threading
+import time
+
+from database import get_db_connection
+from features import recognize_face
+from qr_token import verify_token
+from write_queue import mark_attendance, wait_for
+
+FACE_CHECK_RATE = 0.05       # Share of QR check-ins that are also face-checked at random
+REPEAT_SCAN_WINDOW = 120     # Seconds; the same card marked again this soon is an accidental double scan
+MIN_STAY_MINUTES = 15        # A Time Out this soon after Time In is suspicious (card handed to a friend)
+
+# Outcomes besides write_queue's TIME_IN / TIME_OUT / COMPLETED
+FACE_REQUIRED = "Face Required"    # Resubmit with a camera frame
+DUPLICATE_SCAN = "Duplicate Scan"  # Already marked moments ago; nothing was written
+NOT_RECOGNIZED = "Not Recognized"
+REJECTED = "Rejected"              # Invalid or expired code, or unknown student
+
+# Per process: when each student was last marked through the fast lane, and
+# students who owe a face check (spot-checked, or failed one) until they pass it
+_recent_marks = {}
+_face_check_owed = set()
+_state_lock = threading.Lock()
+
+
+def _todays_pattern(cursor, student_id):
+    """What is suspicious about scanning this card now, given today's record, or None."""
+    cursor.execute("""
+        SELECT time_out IS NOT NULL, time_in > DATETIME('now', ?) FROM attendance
+        WHERE student_id = ? AND time_in >= DATE('now') AND time_in < DATE('now', '+1 day')
+    """, (f"-{MIN_STAY_MINUTES} minutes", student_id))
+    record = cursor.fetchone()
+    if not record:
+        return None
+    checked_out, just_checked_in = record
+    if checked_out:
+        return "card scanned again after today's check-out"
+    if just_checked_in:
+        return f"check-out within {MIN_STAY_MINUTES} minutes of check-in"
+    return None
+
+def _face_check_reason(student_id, pattern):
+    """Why this scan needs a face check, or None. Once asked, the check stays owed until passed."""
+    with _state_lock:
+        if student_id in _face_check_owed:
+            return "face check pending for this card"
+        if pattern:
+            _face_check_owed.add(student_id)
+            return pattern
+        if random.random() < FACE_CHECK_RATE:
+            _face_check_owed.add(student_id)
+            return "random spot check"
+    return None
+
+def claim_mark(student_id):
+    """
+    Reserves this student's mark, so concurrent scans of one card (or a card
+    scan and a face check-in at the same kiosk) cannot both get through. Returns the previous entry to hand back to release_mark, or
+    False if the card was already marked within REPEAT_SCAN_WINDOW.
+    """
+    now = time.monotonic()
+    with _state_lock:
+        last_mark = _recent_marks.get(student_id)
+        if last_mark is not None and now - last_mark < REPEAT_SCAN_WINDOW:
+            return False
+        _recent_marks[student_id] = now
+        if len(_recent_marks) > 10000:
+            for stale_id in [sid for sid, seen in _recent_marks.items() if now - seen > REPEAT_SCAN_WINDOW]:
+                del _recent_marks[stale_id]
+        return (last_mark,)
+
+def release_mark(student_id, claim):
+    """Undoes claim_mark when the scan did not end up marking attendance."""
+    with _state_lock:
+        if claim[0] is None:
+            _recent_marks.pop(student_id, None)
+        else:
+            _recent_marks[student_id] = claim[0]
+
+def fast_lane_check_in(token, photo_bytes=None, recognize=recognize_face):
+    """
+    Marks attendance from a scanned ID card code, running face recognition only
+    for spot checks, suspicious patterns (a scan after today's check-out, or a
+    check-out within MIN_STAY_MINUTES of check-in) and cards that owe one.
+    recognize(face_encoding, photo_bytes) -> (is_recognized, message) lets the
+    caller run recognition on its own worker pool.
+    Returns (outcome, message, face_checked): outcome is TIME_IN, TIME_OUT or
+    COMPLETED from write_queue, or FACE_REQUIRED, DUPLICATE_SCAN,
+    NOT_RECOGNIZED or REJECTED.
+    """
+    student_id, message = verify_token(token)
+    if student_id is None:
+        return REJECTED, message, False
+    # A valid signature only proves we issued the card; the student must still exist
+    with get_db_connection() as cursor:
+        cursor.execute("SELECT face_encoding FROM students WHERE id = ?", (student_id,))
+        student = cursor.fetchone()
+        pattern = _todays_pattern(cursor, student_id) if student else None
+    if not student:
+        return REJECTED, "Student not found.", False
+    claim = claim_mark(student_id)
+    if not claim:
+        return DUPLICATE_SCAN, "Already checked in moments ago.", False
+    try:
+        face_check_reason = _face_check_reason(student_id, pattern)
+        if face_check_reason:
+            if not photo_bytes:
+                release_mark(student_id, claim)
+                return FACE_REQUIRED, f"Face check required ({face_check_reason}).", False
+            is_recognized, message = recognize(student[0], photo_bytes)
+            if not is_recognized:
+                release_mark(student_id, claim)
+                return NOT_RECOGNIZED, message, True
+            with _state_lock:
+                _face_check_owed.discard(student_id)
+        outcome = wait_for(mark_attendance(student_id))
+    except Exception:
+        release_mark(student_id, claim)
+        raise
+    return outcome, "Attendance marked.", bool(face_check_reason)
@@ -6,6 +6,7 @@ import qrcode # type: ignore
 from io import BytesIO
 import streamlit as st # type: ignore # Streamlit is needed for st.error in case of font loading issues
 import numpy as np # type: ignore # Needed for face_recognition encodings
+from qr_token import issue_token
 
 # --- Face Recognition (REAL) ---
 try:
@@ -101,7 +102,7 @@ def generate_id_card(student_data):
     """Generates the student ID card image.
 
     Args:
-        student_data (dict):  Dictionary containing student information.
+        student_data (dict):  Dictionary containing student information, including the student 'id'.
     """
     # ID card dimensions
     width = 800
@@ -204,8 +205,8 @@ def generate_id_card(student_data):
     draw.text((start_x + 150, start_y + 6 * line_height), student_data['favorite_teacher'], fill=black,
               font=text_font)
 
-    # Add QR code
-    qr_data = f"Name: {student_data['name']}, Roll No: {student_data['roll_no']}, Email: {student_data['email']}, Course: {student_data['course']}"
+    # Add QR code: a signed token scanned by the kiosk fast lane (see fast_lane.py)
+    qr_data = issue_token(student_data['id'])
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(qr_data)
     qr.make(fit=True)
@@ -0,0 +1,205 @@
+# print_jobs.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from database import get_db_connection
+from features import process_payment, generate_id_card
+from write_queue import get_write_queue, wait_for
+
+PRINT_WORKERS = 4  # Payments and card renders run in parallel on this pool
+PRINT_CARD_DIR = "print_cards"
+STALE_JOB_MINUTES = 10  # A job still processing after this long was cut off by a restart (workers live in-process)
+
+_executor = ThreadPoolExecutor(max_workers=PRINT_WORKERS, thread_name_prefix="print-job")
+_payment_gateway = process_payment
+
+
+def set_payment_gateway(gateway):
+    """
+    Plugs in a payment gateway. It is called as gateway(amount, token) and must
+    return (status, message) with status "success" or "failure", the same
+    contract as features.process_payment, which is the local stand-in.
+    """
+    global _payment_gateway
+    _payment_gateway = gateway
+
+
+# --- Mutations (run on the writer thread) ---
+def _insert_job(cursor, student_id, idempotency_key, amount):
+    """Creates the job unless the key was already used. Returns (job_id, created)."""
+    cursor.execute("INSERT OR IGNORE INTO print_jobs (student_id, idempotency_key, amount) VALUES (?, ?, ?)",
+                   (student_id, idempotency_key, amount))
+    created = cursor.rowcount == 1
+    cursor.execute("SELECT id FROM print_jobs WHERE idempotency_key = ?", (idempotency_key,))
+    return cursor.fetchone()[0], created
+
+def _record_payment(cursor, job_id, payment_status, payment_message):
+    cursor.execute("""
+        UPDATE print_jobs SET payment_status = ?, payment_message = ?, updated_at = DATETIME('now') WHERE id = ?
+    """, (payment_status, payment_message, job_id))
+
+def _record_card(cursor, job_id, card_path):
+    cursor.execute("""
+        UPDATE print_jobs SET card_status = ?, card_path = ?, updated_at = DATETIME('now') WHERE id = ?
+    """, ("ready" if card_path else "failed", card_path, job_id))
+
+def _settle(cursor, job_id):
+    """Marks the job done or failed once both the payment and the render have finished."""
+    cursor.execute("""
+        UPDATE print_jobs
+        SET status = CASE WHEN payment_status = 'success' AND card_status = 'ready' THEN 'done' ELSE 'failed' END,
+            updated_at = DATETIME('now')
+        WHERE id = ? AND payment_status != 'pending' AND card_status != 'pending'
+    """, (job_id,))
+
+def _reopen_job(cursor, job_id):
+    """Puts a failed job back into processing, keeping whichever half already succeeded."""
+    cursor.execute("SELECT student_id, amount, payment_status, card_status FROM print_jobs WHERE id = ? AND status = 'failed'",
+                   (job_id,))
+    job = cursor.fetchone()
+    if not job:
+        return None
+    student_id, amount, payment_status, card_status = job
+    cursor.execute("""
+        UPDATE print_jobs
+        SET status = 'processing',
+            payment_status = CASE WHEN payment_status = 'success' THEN payment_status ELSE 'pending' END,
+            card_status = CASE WHEN card_status = 'ready' THEN card_status ELSE 'pending' END,
+            updated_at = DATETIME('now')
+        WHERE id = ?
+    """, (job_id,))
+    return student_id, amount, payment_status != "success", card_status != "ready"
+
+def _fail_stale_jobs(cursor, stale_minutes):
+    """
+    Fails jobs left processing by a previous process, keeping whichever half had
+    finished, so the student can retry them. Returns the number of jobs failed.
+    """
+    cursor.execute("""
+        UPDATE print_jobs
+        SET status = 'failed',
+            payment_status = CASE WHEN payment_status = 'pending' THEN 'failure' ELSE payment_status END,
+            payment_message = CASE WHEN payment_status = 'pending'
+                                   THEN 'Interrupted before the payment finished. Please retry.'
+                                   ELSE payment_message END,
+            card_status = CASE WHEN card_status = 'pending' THEN 'failed' ELSE card_status END,
+            updated_at = DATETIME('now')
+        WHERE status = 'processing' AND COALESCE(updated_at, created_at) < DATETIME('now', ?)
+    """, (f"-{stale_minutes} minutes",))
+    return cursor.rowcount
+
+
+# --- Worker tasks ---
+def _pay(job_id, amount, token):
+    try:
+        payment_status, payment_message = _payment_gateway(amount, token)
+    except Exception as e:
+        payment_status, payment_message = "failure", f"Payment error: {e}"
+    writer = get_write_queue()
+    writer.submit(_record_payment, job_id, payment_status, payment_message)
+    writer.submit(_settle, job_id)
+
+def _render(job_id, student_data):
+    card_path = None
+    try:
+        card = generate_id_card(student_data)
+        if card:
+            os.makedirs(PRINT_CARD_DIR, exist_ok=True)
+            card_path = os.path.join(PRINT_CARD_DIR, f"job_{job_id}.png")
+            with open(card_path, "wb") as f:
+                f.write(card)
+    except Exception as e:
+        print(f"Error rendering ID card for print job {job_id}: {e}")
+        card_path = None
+    writer = get_write_queue()
+    writer.submit(_record_card, job_id, card_path)
+    writer.submit(_settle, job_id)
+
+def _load_card_data(student_id):
+    """Student details in the shape generate_id_card expects."""
+    with get_db_connection() as cursor:
+        cursor.execute("""
+            SELECT s.id, s.name, s.roll_no, s.email, s.slot, s.contact, c.name, t.name, s.photo
+            FROM students s
+            JOIN courses c ON s.course_id = c.id
+            JOIN teachers t ON s.favorite_teacher_id = t.id
+            WHERE s.id = ?
+        """, (student_id,))
+        row = cursor.fetchone()
+    if not row:
+        return None
+    keys = ['id', 'name', 'roll_no', 'email', 'slot', 'contact', 'course', 'favorite_teacher', 'photo']
+    return dict(zip(keys, row))
+
+
+# --- Public API ---
+def recover_stale_jobs():
+    """
+    Fails jobs orphaned by a restart (still processing after STALE_JOB_MINUTES)
+    so the UI offers Retry for them. Only goes through the writer when there is
+    something to fix. Returns the number of jobs failed.
+    """
+    with get_db_connection() as cursor:
+        cursor.execute("""
+            SELECT 1 FROM print_jobs
+            WHERE status = 'processing' AND COALESCE(updated_at, created_at) < DATETIME('now', ?)
+            LIMIT 1
+        """, (f"-{STALE_JOB_MINUTES} minutes",))
+        if not cursor.fetchone():
+            return 0
+    return wait_for(get_write_queue().submit(_fail_stale_jobs, STALE_JOB_MINUTES))
+
+def submit_print_job(student_id, student_data, amount, token, idempotency_key):
+    """
+    Queues a paid ID-card print and returns its job id immediately. The payment
+    and the card render run in parallel on the worker pool. Submitting again
+    with the same idempotency key returns the existing job without charging twice.
+    """
+    job_id, created = wait_for(get_write_queue().submit(_insert_job, student_id, idempotency_key, amount))
+    if created:
+        _executor.submit(_pay, job_id, amount, token)
+        _executor.submit(_render, job_id, student_data)
+    return job_id
+
+def retry_print_job(job_id, token):
+    """
+    Retries a failed job. Only the failed half is redone: a card that already
+    rendered is kept when the payment is retried, and vice versa.
+    Returns False if the job is not in a failed state.
+    """
+    reopened = wait_for(get_write_queue().submit(_reopen_job, job_id))
+    if not reopened:
+        return False
+    student_id, amount, retry_payment, retry_render = reopened
+    student_data = _load_card_data(student_id) if retry_render else None
+    if retry_render and not student_data:
+        get_write_queue().submit(_record_card, job_id, None)
+        retry_render = False
+    if retry_payment:
+        _executor.submit(_pay, job_id, amount, token)
+    if retry_render:
+        _executor.submit(_render, job_id, student_data)
+    get_write_queue().submit(_settle, job_id)
+    return True
+
+def list_print_jobs(student_id):
+    """Returns (id, status, payment_status, payment_message, card_status, created_at) for a student's jobs, newest first."""
+    with get_db_connection() as cursor:
+        cursor.execute("""
+            SELECT id, status, payment_status, payment_message, card_status, created_at
+            FROM print_jobs WHERE student_id = ? ORDER BY id DESC
+        """, (student_id,))
+        return cursor.fetchall()
+
+def get_print_card(job_id):
+    """Rendered card bytes for a job, read from disk, or None if it has not rendered."""
+    with get_db_connection() as cursor:
+        cursor.execute("SELECT card_path FROM print_jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+    if not row or not row[0]:
+        return None
+    try:
+        with open(row[0], "rb") as f:
+            return f.read()
+    except OSError:
+        return None
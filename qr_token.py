@@ -0,0 +1,72 @@
+# qr_token.py
+import base64
+import datetime
+import hashlib
+import hmac
+import os
+import secrets
+import struct
+
+from database import get_db_connection
+
+TOKEN_PREFIX = "Q3:"
+SIGNATURE_BYTES = 10  # Truncated HMAC-SHA256; keeps the QR code small
+MAX_TOKEN_AGE_DAYS = 365  # Cards older than this must be reissued
+_EPOCH = datetime.date(2020, 1, 1)
+_PAYLOAD = struct.Struct(">IH")  # student id, issue date as days since _EPOCH
+
+_secret = None
+
+
+def _get_secret():
+    """
+    Signing key from PORTAL_QR_SECRET, or else a random key generated once and
+    kept in the settings table so the app and the kiosk API agree on it.
+    """
+    global _secret
+    if _secret is None:
+        env_secret = os.environ.get("PORTAL_QR_SECRET")
+        if env_secret:
+            _secret = env_secret.encode()
+        else:
+            with get_db_connection() as cursor:
+                cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('qr_secret', ?)",
+                               (secrets.token_hex(32),))
+                cursor.execute("SELECT value FROM settings WHERE key = 'qr_secret'")
+                _secret = cursor.fetchone()[0].encode()
+    return _secret
+
+def _sign(payload):
+    return hmac.new(_get_secret(), payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+def issue_token(student_id, issue_date=None):
+    """
+    Returns the compact signed token printed in the ID card's QR code.
+    Base32 keeps it in the QR alphanumeric character set, which encodes denser than bytes.
+    """
+    issue_date = issue_date or datetime.date.today()
+    payload = _PAYLOAD.pack(student_id, (issue_date - _EPOCH).days)
+    return TOKEN_PREFIX + base64.b32encode(payload + _sign(payload)).decode().rstrip("=")
+
+def verify_token(token):
+    """
+    Checks a scanned token's signature and age.
+    Returns (student_id, message); student_id is None if the token is rejected.
+    """
+    if not token or not token.startswith(TOKEN_PREFIX):
+        return None, "Not a student ID card code."
+    encoded = token[len(TOKEN_PREFIX):]
+    try:
+        raw = base64.b32decode(encoded + "=" * (-len(encoded) % 8))
+    except (ValueError, TypeError):
+        return None, "Malformed ID card code."
+    if len(raw) != _PAYLOAD.size + SIGNATURE_BYTES:
+        return None, "Malformed ID card code."
+    payload, signature = raw[:_PAYLOAD.size], raw[_PAYLOAD.size:]
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None, "ID card code signature is invalid."
+    student_id, issue_days = _PAYLOAD.unpack(payload)
+    age_days = (datetime.date.today() - _EPOCH).days - issue_days
+    if age_days < 0 or age_days > MAX_TOKEN_AGE_DAYS:
+        return None, "ID card has expired. Please print a new one."
+    return student_id, "ID card code verified."
@@ -0,0 +1,70 @@
+# replica.py
+import os
+import sqlite3
+import threading
+import time
+
+from database import DB_PATH
+from archive import get_history_connection
+
+REPLICA_PATH = "student_portal_replica.db"
+REFRESH_INTERVAL = 60  # Seconds between snapshots
+
+_refresh_lock = threading.Lock()
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def refresh_replica():
+    """
+    Copies the live database into a read-only snapshot using SQLite's online
+    backup API. The copy is taken in one step inside a single read transaction;
+    with the live file in WAL mode that never blocks the attendance writer.
+    The new snapshot replaces the old one atomically, so readers already open
+    keep the snapshot they started with.
+    """
+    with _refresh_lock:
+        tmp_path = REPLICA_PATH + ".tmp"
+        src = sqlite3.connect(DB_PATH)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dst)
+            # The copy inherits WAL mode; a rollback-journal file can be opened read-only without -shm/-wal files
+            dst.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp_path, REPLICA_PATH)
+
+def replica_age():
+    """Seconds since the current snapshot was taken, or None if there is none yet."""
+    try:
+        return time.time() - os.path.getmtime(REPLICA_PATH)
+    except OSError:
+        return None
+
+def _refresh_loop(interval):
+    while True:
+        try:
+            refresh_replica()
+        except Exception as e:  # e.g. sqlite3.Error, or OSError from the file swap; retry next interval
+            print(f"Error refreshing read replica: {e}")
+        time.sleep(interval)
+
+def start_replica_refresher(interval=REFRESH_INTERVAL):
+    """Starts the background snapshot thread, or restarts it if it has died."""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = threading.Thread(target=_refresh_loop, args=(interval,), name="replica-refresher", daemon=True)
+            _refresher.start()
+
+def get_replica_connection(include_archives=False):
+    """
+    Read-only cursor on the latest snapshot, for admin listings and reports.
+    Yields (cursor, omitted_terms) with the same attendance_all / results_all
+    views as get_history_connection.
+    """
+    if replica_age() is None:
+        refresh_replica()
+    return get_history_connection(include_archives=include_archives, db_path=REPLICA_PATH)
@@ -0,0 +1,224 @@
+# write_queue.py
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from database import DB_PATH
+
+# Attendance outcomes resolved on the caller's future
+TIME_IN = "Time In"
+TIME_OUT = "Time Out"
+COMPLETED = "Completed"
+
+BATCH_SIZE = 64       # Max mutations committed in one transaction
+BATCH_WAIT = 0.01     # Seconds to wait for more work before committing a batch
+WRITE_TIMEOUT = 30    # Seconds callers wait on a Future before giving up
+_STOP = object()
+
+
+# --- Mutations (run on the writer thread only) ---
+def _mark_attendance(cursor, student_id):
+    """Marks Time In, or Time Out if already checked in today."""
+    # Range on time_in (not DATE(time_in)) so the lookup uses idx_attendance_student_time_in
+    cursor.execute("""
+        SELECT id, time_in, time_out FROM attendance
+        WHERE student_id = ? AND time_in >= DATE('now') AND time_in < DATE('now', '+1 day')
+    """, (student_id,))
+    attendance_record = cursor.fetchone()
+    if attendance_record:
+        if attendance_record[2]:
+            return COMPLETED
+        cursor.execute("UPDATE attendance SET time_out = DATETIME('now') WHERE id = ?", (attendance_record[0],))
+        return TIME_OUT
+    cursor.execute("INSERT INTO attendance (student_id, time_in) VALUES (?, DATETIME('now'))", (student_id,))
+    return TIME_IN
+
+def _submit_marks(cursor, student_id, marks):
+    """Inserts or updates the student's marks."""
+    cursor.execute("SELECT id FROM results WHERE student_id = ?", (student_id,))
+    if cursor.fetchone():
+        cursor.execute("UPDATE results SET marks = ?, submitted_at = DATETIME('now') WHERE student_id = ?", (marks, student_id))
+        return "updated"
+    cursor.execute("INSERT INTO results (student_id, marks, submitted_at) VALUES (?, ?, DATETIME('now'))", (student_id, marks))
+    return "inserted"
+
+def _save_student(cursor, user_id, name, roll_no, email, slot, contact, course_id, favorite_teacher_id, photo, face_encoding):
+    """Inserts or updates the student registration for a user."""
+    cursor.execute("SELECT id FROM students WHERE user_id = ?", (user_id,))
+    if cursor.fetchone():
+        cursor.execute("""
+            UPDATE students SET name=?, roll_no=?, email=?, slot=?, contact=?, course_id=?,
+            favorite_teacher_id=?, photo=?, face_encoding=? WHERE user_id=?
+        """, (name, roll_no, email, slot, contact, course_id, favorite_teacher_id, photo, face_encoding, user_id))
+        return "updated"
+    cursor.execute("""
+        INSERT INTO students (user_id, name, roll_no, email, slot, contact, course_id, favorite_teacher_id, photo, face_encoding)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, name, roll_no, email, slot, contact, course_id, favorite_teacher_id, photo, face_encoding))
+    return "inserted"
+
+
+class WriteQueue:
+    """
+    Single writer thread that owns the only write connection to the database.
+    Callers submit mutations and get a Future; the writer drains the queue and
+    group-commits up to BATCH_SIZE mutations per transaction, so a check-in
+    burst costs one lock acquisition and one fsync per batch instead of one
+    per student.
+    """
+    def __init__(self, db_path=DB_PATH, batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._error = None  # Set when the writer thread has died; no more work is accepted
+        self._error_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        """True while the writer thread can still accept work."""
+        return self._error is None and self._thread.is_alive()
+
+    def submit(self, func, *args):
+        """Queues func(cursor, *args) and returns a Future with its return value."""
+        future = Future()
+        with self._error_lock:
+            if self._error is not None:
+                future.set_exception(RuntimeError(f"Database writer has stopped: {self._error}"))
+                return future
+            self._queue.put((func, args, future))
+        return future
+
+    def stop(self):
+        """Flushes pending mutations and stops the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _fail_pending(self, error):
+        """Marks the writer dead and fails everything still queued, so no caller waits forever."""
+        with self._error_lock:
+            self._error = error
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP and not item[2].done():
+                item[2].set_exception(RuntimeError(f"Database writer has stopped: {error}"))
+
+    def _run(self):
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_path, isolation_level=None)  # Transactions are managed explicitly
+            conn.execute("PRAGMA busy_timeout=5000")
+            # WAL lets readers keep going while the writer commits. Switching needs a moment
+            # with no other readers; if one is holding the file, carry on and try again next start.
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.OperationalError as e:
+                print(f"Could not switch database to WAL mode: {e}")
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                batch = [item]
+                stopping = False
+                deadline = time.monotonic() + self.batch_wait
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._commit_batch(conn, batch)
+                if stopping:
+                    return
+        except Exception as e:
+            print(f"Database writer stopped: {e}")
+            self._fail_pending(e)
+        finally:
+            if self._error is None:
+                self._fail_pending("writer shut down")
+            if conn is not None:
+                conn.close()
+
+    def _commit_batch(self, conn, batch):
+        """Runs a batch in one transaction; each mutation gets its own savepoint."""
+        outcomes = []
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for func, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cursor.execute("SAVEPOINT mutation")
+                try:
+                    result = func(cursor, *args)
+                except Exception as e:
+                    # Undo only this mutation; the rest of the batch still commits
+                    cursor.execute("ROLLBACK TO mutation")
+                    cursor.execute("RELEASE mutation")
+                    future.set_exception(e)
+                else:
+                    cursor.execute("RELEASE mutation")
+                    outcomes.append((future, result))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for func, args, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # Resolve only after COMMIT so callers never see an outcome that was rolled back
+        for future, result in outcomes:
+            future.set_result(result)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def wait_for(future, timeout=WRITE_TIMEOUT):
+    """
+    Waits for a queued mutation's outcome. On timeout the mutation is cancelled
+    if the writer has not started it, so a reported failure never turns into a
+    late write. If the writer already has it in hand, its batch is about to
+    commit or fail, so wait for that real outcome instead.
+    """
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        if future.cancel():
+            raise
+        return future.result(timeout=timeout)
+
+def get_write_queue():
+    """Returns the process-wide writer, starting it on first use or replacing it if it died."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = WriteQueue()
+            atexit.register(_writer.stop)
+        return _writer
+
+def mark_attendance(student_id):
+    """Queues an attendance mark; the Future resolves to TIME_IN, TIME_OUT or COMPLETED."""
+    return get_write_queue().submit(_mark_attendance, student_id)
+
+def submit_marks(student_id, marks):
+    """Queues a marks submission; the Future resolves to 'inserted' or 'updated'."""
+    return get_write_queue().submit(_submit_marks, student_id, marks)
+
+def save_student(user_id, name, roll_no, email, slot, contact, course_id, favorite_teacher_id, photo, face_encoding):
+    """Queues a registration insert/update; the Future resolves to 'inserted' or 'updated'."""
+    return get_write_queue().submit(_save_student, user_id, name, roll_no, email, slot, contact,
+                                    course_id, favorite_teacher_id, photo, face_encoding)